@@ -4,15 +4,29 @@ Advanced WMTS tile downloader for New Zealand ocean data visualization
 Supports multiple data types: temperature, anomaly, salinity, currents
 """
 
-import urllib.request
-import urllib.error
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import sys
 import os
 import argparse
+import functools
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+import threading
+import re
+import traceback
+import urllib.parse
+import xml.etree.ElementTree as ET
 
 # Preset layers
 LAYERS = {
@@ -49,10 +63,50 @@ NZ_COVERAGE = {
     7: {'row_start': 88, 'row_end': 96, 'col_start': 246, 'col_end': 254},  # ~2304x2304px
 }
 
+# Copernicus Marine WMTS endpoint (KVP encoding)
+WMTS_URL = "https://wmts.marine.copernicus.eu/teroWmts"
+
+# Display timezone for the maps; the WMTS API itself works in UTC
+NZ_TZ = ZoneInfo('Pacific/Auckland')
+UTC = timezone.utc
+
+# WMTS tile edge length and title banner height in pixels
+TILE_SIZE = 256
+TITLE_HEIGHT = 60
+
+# On-disk cache for tiles and legend SVGs
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'nz_ocean_map')
+
+# Forecast tiles for a given TIME can be revised by each 6-hourly model run, so
+# older cached tiles are revalidated with a conditional GET before reuse
+TILE_CACHE_MAX_AGE = 6 * 60 * 60
+
+# Legends depend only on (layer, style), so cached SVGs stay valid for a week
+LEGEND_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Every model run adds a new set of tiles, so files not written or revalidated
+# within the legend lifetime are deleted at the start of each run
+CACHE_PRUNE_AGE = LEGEND_CACHE_MAX_AGE
+
+# Patterns for SVG stop colours ("rgb(r, g, b)") and numeric legend labels
+RGB_RE = re.compile(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)')
+NUMBER_RE = re.compile(r'([-\d.]+)')
+
+# Resolution the legend gradient is computed at before being resized to the bar
+LEGEND_GRADIENT_STEPS = 1024
+
+@functools.lru_cache(maxsize=8)
+def get_font(size):
+    """Load the banner/legend font once per size, falling back to Pillow's default"""
+    try:
+        return ImageFont.truetype("font/PressStart2P.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
 def get_time_param(days_offset=0, hour_offset=0):
     """
     Get time parameter rounded to nearest 6-hour interval
-    Uses Pacific/Auckland timezone for input, converts to UTC for API
+    Computed in UTC for the API, also returned in Pacific/Auckland time for display
     
     Args:
         days_offset: Days from now (0=today, 1=tomorrow, -1=yesterday)
@@ -61,82 +115,186 @@ def get_time_param(days_offset=0, hour_offset=0):
     Returns:
         Tuple of (UTC time string in ISO format, NZ time datetime object)
     """
-    # Get current time in NZ timezone
-    nz_tz = ZoneInfo('Pacific/Auckland')
-    now_nz = datetime.now(nz_tz)
-    target_nz = now_nz + timedelta(days=days_offset, hours=hour_offset)
-    
-    # Convert to UTC for the API
-    target_utc = target_nz.astimezone(ZoneInfo('UTC'))
-    rounded_hour = (target_utc.hour // 6) * 6
-    time_rounded_utc = target_utc.replace(hour=rounded_hour, minute=0, second=0, microsecond=0)
-    
-    # Also get the NZ time for display
-    time_rounded_nz = time_rounded_utc.astimezone(nz_tz)
-    
-    return time_rounded_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z'), time_rounded_nz
-
-def download_tile(layer, tilematrix, tilerow, tilecol, time_param, elevation=None, style="cmap:thermal"):
-    """Download a single WMTS tile"""
-    base_url = "https://wmts.marine.copernicus.eu/teroWmts"
-    
-    url = (
-        f"{base_url}?SERVICE=WMTS&REQUEST=GetTile"
-        f"&LAYER={layer}"
-        f"&STYLE={style}"
-        f"&TILEMATRIXSET=EPSG:4326"
-        f"&TILEMATRIX={tilematrix}"
-        f"&TILEROW={tilerow}"
-        f"&TILECOL={tilecol}"
-        f"&FORMAT=image/png"
-        f"&TIME={time_param}"
+    # Round down to the 6-hourly model step in UTC, then convert for display
+    target_utc = datetime.now(UTC) + timedelta(days=days_offset, hours=hour_offset)
+    time_rounded_utc = target_utc.replace(hour=(target_utc.hour // 6) * 6, minute=0, second=0, microsecond=0)
+
+    return time_rounded_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z'), time_rounded_utc.astimezone(NZ_TZ)
+
+def create_session(pool_maxsize=16):
+    """Create an HTTP session with a pooled keep-alive connection to the WMTS host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_maxsize,
+        # Retry transient failures with jittered exponential backoff, waiting at
+        # least as long as a 429/503 Retry-After asks; other 4xx are final
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.3,
+            backoff_jitter=0.3,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True
+        )
     )
-    
+    session.mount('https://', adapter)
+    return session
+
+def write_atomic(path, data):
+    """Write bytes to path via a temporary file so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def prune_cache(max_age=CACHE_PRUNE_AGE):
+    """Delete cached files older than max_age seconds"""
+    cutoff = time.time() - max_age
+    try:
+        entries = os.scandir(CACHE_DIR)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+def build_wmts_url(params, safe=':/,'):
+    """Encode WMTS KVP parameters in one pass (by default ':', '/' and ',' in ids stay literal)"""
+    return f"{WMTS_URL}?{urllib.parse.urlencode(params, safe=safe)}"
+
+def write_progress(message):
+    """Write one progress line in a single call so concurrent workers never interleave"""
+    sys.stdout.write(f"  {message}\n")
+
+def download_tile(session, layer, tilematrix, tilerow, tilecol, time_param, elevation=None, style="cmap:thermal",
+                  use_cache=True, report=write_progress, tile_format='png'):
+    """Download a single WMTS tile (png or jpeg) using a shared session, reusing the on-disk cache if enabled"""
+    params = {
+        'SERVICE': 'WMTS',
+        'REQUEST': 'GetTile',
+        'LAYER': layer,
+        'STYLE': style,
+        'TILEMATRIXSET': 'EPSG:4326',
+        'TILEMATRIX': tilematrix,
+        'TILEROW': tilerow,
+        'TILECOL': tilecol,
+        'FORMAT': f'image/{tile_format}',
+        'TIME': time_param,
+    }
     if elevation:
-        url += f"&ELEVATION={elevation}"
-    
+        params['ELEVATION'] = elevation
+    url = build_wmts_url(params)
+
+    key = hashlib.sha1(
+        f"{layer}|{tilematrix}|{tilerow}|{tilecol}|{time_param}|{elevation}|{style}|{tile_format}".encode()
+    ).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{key}.{tile_format}")
+    validators_path = cache_path + '.json'
+
+    stale = False
     try:
-        print(f"  Tile [{tilerow},{tilecol}]...", end=" ", flush=True)
-        with urllib.request.urlopen(url, timeout=30) as response:
-            img_data = response.read()
-            img = Image.open(BytesIO(img_data))
-            print("✓")
-            return img
+        headers = {}
+        if use_cache and os.path.exists(cache_path):
+            if time.time() - os.path.getmtime(cache_path) < TILE_CACHE_MAX_AGE:
+                img = Image.open(cache_path)
+                img.load()
+                report(f"Tile [{tilerow},{tilecol}] ✓ (cached)")
+                return img
+            # Stale: ask the server whether the tile changed, using the
+            # ETag/Last-Modified it sent with the cached copy (an unreadable
+            # validators file just means a full download)
+            stale = True
+            try:
+                with open(validators_path) as f:
+                    headers = json.load(f)
+            except (OSError, ValueError):
+                headers = {}
+
+        # Stream the body straight into a single buffer rather than building
+        # response.content and copying it again into a BytesIO
+        buf = BytesIO()
+        with session.get(url, timeout=30, stream=True, headers=headers) as response:
+            if response.status_code == 304:
+                os.utime(cache_path)
+                os.utime(validators_path)
+                img = Image.open(cache_path)
+                img.load()
+                report(f"Tile [{tilerow},{tilecol}] ✓ (not modified)")
+                return img
+            response.raise_for_status()
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, buf, 64 * 1024)
+        buf.seek(0)
+        img = Image.open(buf)
+        # Decode fully before caching so a truncated download is never stored
+        img.load()
+        if use_cache:
+            write_atomic(cache_path, buf.getbuffer())
+            validators = {}
+            if 'ETag' in response.headers:
+                validators['If-None-Match'] = response.headers['ETag']
+            if 'Last-Modified' in response.headers:
+                validators['If-Modified-Since'] = response.headers['Last-Modified']
+            write_atomic(validators_path, json.dumps(validators).encode())
+        report(f"Tile [{tilerow},{tilecol}] ✓")
+        return img
     except Exception as e:
-        print(f"✗ {e}")
+        # A client error (unknown layer, time outside the dataset, ...) will hit
+        # every tile, so let it abort the run instead of leaving a blank map
+        if isinstance(e, requests.HTTPError) and 400 <= e.response.status_code < 500:
+            raise
+        # Keep the stale copy rather than leaving a black square
+        if stale:
+            try:
+                img = Image.open(cache_path)
+                img.load()
+                report(f"Tile [{tilerow},{tilecol}] ✓ (stale: {e})")
+                return img
+            except Exception:
+                pass
+        report(f"Tile [{tilerow},{tilecol}] ✗ {e}")
         return None
 
-def print_legend_to_terminal(color_values, labels):
+def print_legend_to_terminal(color_values, labels, write=sys.stdout.write):
     """
     Print a visual representation of the legend to the terminal using ANSI colors
+    Skipped when stdout is not a TTY or NO_COLOR is set
 
     Args:
         color_values: List of RGB tuples
         labels: List of (y_position, label_text) tuples
+        write: Callable that receives the output text
     """
     if not color_values:
         return
 
-    print("\n  Legend Preview:")
-    print("  " + "─" * 40)
+    # ANSI colour swatches only bloat redirected output and CI logs
+    if not sys.stdout.isatty() or os.environ.get('NO_COLOR'):
+        return
 
-    # Display ~20 color bars
+    # Display ~20 color bars spread evenly across the scale
     num_bars = min(20, len(color_values))
-    step = len(color_values) // num_bars if num_bars > 0 else 1
-
-    for i in range(num_bars):
-        idx = min(i * step, len(color_values) - 1)
-        r, g, b = color_values[idx]
-        # ANSI escape code for RGB color
-        color_code = f"\033[48;2;{r};{g};{b}m"
-        reset_code = "\033[0m"
-        bar = color_code + "    " + reset_code
-        print(f"  {bar} rgb({r:3d}, {g:3d}, {b:3d})")
-
-    print("  " + "─" * 40)
+    idxs = np.linspace(0, len(color_values) - 1, num_bars).astype(int)
+
+    # ANSI escape code for RGB color, built up and written in one go
+    lines = ["", "  Legend Preview:", "  " + "─" * 40]
+    lines += [
+        f"  \033[48;2;{r};{g};{b}m    \033[0m rgb({r:3d}, {g:3d}, {b:3d})"
+        for r, g, b in (color_values[i] for i in idxs)
+    ]
+    lines.append("  " + "─" * 40)
     if labels:
-        print(f"  Range: {labels[0][1] if labels else 'N/A'} to {labels[-1][1] if labels else 'N/A'}")
-    print()
+        lines.append(f"  Range: {labels[0][1]} to {labels[-1][1]}")
+    write("\n".join(lines) + "\n\n")
 
 def create_legend_image(colors, labels, target_height, bar_width=60, data_type='temperature'):
     """
@@ -152,50 +310,44 @@ def create_legend_image(colors, labels, target_height, bar_width=60, data_type='
     Returns:
         PIL Image object
     """
-    from PIL import ImageDraw, ImageFont
-    import re
-
     # Dimensions
     padding = 40
     label_width = 120
     total_width = padding + bar_width + padding + label_width + padding
 
-    # Create image
-    img = Image.new('RGB', (total_width, target_height), color='white')
-    draw = ImageDraw.Draw(img)
-
     # Calculate gradient bar position
     bar_x = padding
     bar_y_start = padding * 2
     bar_y_end = target_height - padding * 2
     bar_height = bar_y_end - bar_y_start
 
-    # Draw the gradient bar
-    for y in range(bar_height):
-        ratio = y / bar_height
-        # Find the two colors to interpolate between
-        for i in range(len(colors) - 1):
-            offset1, color1 = colors[i]
-            offset2, color2 = colors[i + 1]
-            if offset1 / 100 <= ratio <= offset2 / 100:
-                # Interpolate between the two colors
-                blend = (ratio - offset1 / 100) / ((offset2 - offset1) / 100) if offset2 != offset1 else 0
-                r = int(color1[0] * (1 - blend) + color2[0] * blend)
-                g = int(color1[1] * (1 - blend) + color2[1] * blend)
-                b = int(color1[2] * (1 - blend) + color2[2] * blend)
-                draw.line([(bar_x, bar_y_start + y), (bar_x + bar_width, bar_y_start + y)], fill=(r, g, b))
-                break
-
-    # Draw border around gradient bar
-    draw.rectangle([bar_x, bar_y_start, bar_x + bar_width, bar_y_end], outline='black', width=2)
+    # All pixel work happens on a white NumPy canvas; PIL is only used for text
+    canvas = np.full((target_height, total_width, 3), 255, dtype=np.uint8)
+
+    # Draw the gradient bar: interpolate a fixed-resolution column once, then let
+    # Pillow's C resampler stretch it to the bar (text is still drawn at full size)
+    if colors:
+        offsets = np.array([c[0] for c in colors]) / 100.0
+        rgb = np.array([c[1] for c in colors], dtype=np.float32)
+        ys = np.arange(LEGEND_GRADIENT_STEPS, dtype=np.float32) / LEGEND_GRADIENT_STEPS
+        col = np.stack([np.interp(ys, offsets, rgb[:, i]) for i in range(3)], axis=-1).astype(np.uint8)
+        column = Image.frombytes('RGB', (1, LEGEND_GRADIENT_STEPS), col.tobytes())
+        gradient = column.resize((bar_width, bar_height), Image.Resampling.BILINEAR)
+        canvas[bar_y_start:bar_y_end, bar_x:bar_x + bar_width] = np.asarray(gradient)
+
+    # Draw 2px border around gradient bar (edges inclusive, as ImageDraw.rectangle)
+    bar_x_end = bar_x + bar_width
+    canvas[bar_y_start:bar_y_start + 2, bar_x:bar_x_end + 1] = 0
+    canvas[bar_y_end - 1:bar_y_end + 1, bar_x:bar_x_end + 1] = 0
+    canvas[bar_y_start:bar_y_end + 1, bar_x:bar_x + 2] = 0
+    canvas[bar_y_start:bar_y_end + 1, bar_x_end - 1:bar_x_end + 1] = 0
+
+    img = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(img)
 
     # Load font (larger for better readability)
-    try:
-        font_large = ImageFont.truetype("font/PressStart2P.ttf", 24)
-        font_title = ImageFont.truetype("font/PressStart2P.ttf", 18)
-    except:
-        font_large = ImageFont.load_default()
-        font_title = ImageFont.load_default()
+    font_large = get_font(24)
+    font_title = get_font(18)
 
     # Draw title based on data type
     title_map = {
@@ -219,12 +371,8 @@ def create_legend_image(colors, labels, target_height, bar_width=60, data_type='
         draw.text((unit_x, padding // 2 + 25), unit, fill='black', font=font_title)
 
     # Extract numeric values from labels
-    values = []
-    for _, label_text in labels:
-        # Try to extract numeric value
-        match = re.search(r'([-\d.]+)', label_text)
-        if match:
-            values.append(float(match.group(1)))
+    values = [float(match.group(1)) for _, label_text in labels
+              if (match := NUMBER_RE.search(label_text))]
 
     if values:
         min_val = min(values)
@@ -258,7 +406,7 @@ def create_legend_image(colors, labels, target_height, bar_width=60, data_type='
 
     return img
 
-def parse_svg_legend(svg_data, target_height=None, data_type='temperature'):
+def parse_svg_legend(svg_data, target_height=None, data_type='temperature', write=sys.stdout.write):
     """
     Parse SVG legend and extract colors and labels from gradient stops
 
@@ -266,61 +414,54 @@ def parse_svg_legend(svg_data, target_height=None, data_type='temperature'):
         svg_data: SVG XML data as bytes
         target_height: Target height for the legend (default: original SVG height)
         data_type: Type of data for legend customization
+        write: Callable that receives the terminal preview and errors
 
     Returns:
         PIL Image object or None
     """
-    import xml.etree.ElementTree as ET
-    import re
-
     try:
-        root = ET.fromstring(svg_data)
-        ns = {'svg': 'http://www.w3.org/2000/svg'}
-
-        # Extract SVG dimensions
-        width = int(root.get('width', 125))
-        height = int(root.get('height', 300))
-
-        # Find gradient stops
-        stops = root.findall('.//svg:linearGradient/svg:stop', ns)
-        if not stops:
-            # Fallback: try without namespace
-            stops = root.findall('.//stop')
-
         colors = []
-        for stop in stops:
-            stop_color = stop.get('stop-color')
-            offset = stop.get('offset', '0%').rstrip('%')
-
-            if stop_color and stop_color.startswith('rgb'):
-                # Parse rgb(r,g,b) format
-                match = re.match(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)', stop_color)
-                if match:
-                    r, g, b = map(int, match.groups())
-                    offset_val = float(offset)
-                    colors.append((offset_val, (r, g, b)))
+        labels = []
+
+        # Single streaming pass over the document: gradient stops and text
+        # labels are read as they close and then cleared, so the full tree is
+        # never built up. Matching on the local tag name handles the SVG
+        # namespace and namespace-less documents alike.
+        context = ET.iterparse(BytesIO(svg_data), events=('end',))
+        for _, elem in context:
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if tag == 'stop':
+                stop_color = elem.get('stop-color')
+                offset = elem.get('offset', '0%').rstrip('%')
+
+                if stop_color and stop_color.startswith('rgb'):
+                    # Parse rgb(r,g,b) format
+                    match = RGB_RE.match(stop_color)
+                    if match:
+                        r, g, b = map(int, match.groups())
+                        offset_val = float(offset)
+                        colors.append((offset_val, (r, g, b)))
+                elem.clear()
+            elif tag == 'text':
+                y = float(elem.get('y', 0))
+                label_text = ''.join(elem.itertext()).strip()
+                if label_text:
+                    labels.append((y, label_text))
+                elem.clear()
+
+        # Extract SVG dimensions (the root element itself is never cleared)
+        width = int(context.root.get('width', 125))
+        height = int(context.root.get('height', 300))
 
         # Sort by offset
         colors.sort(key=lambda x: x[0])
         color_values = [c[1] for c in colors]
 
-        # Extract text labels
-        texts = root.findall('.//svg:text', ns)
-        if not texts:
-            texts = root.findall('.//text')
-
-        labels = []
-        for text in texts:
-            y = float(text.get('y', 0))
-            label_text = ''.join(text.itertext()).strip()
-            if label_text:
-                labels.append((y, label_text))
-
         # Sort labels by y position
         labels.sort(key=lambda x: x[0])
 
         # Print legend to terminal
-        print_legend_to_terminal(color_values, labels)
+        print_legend_to_terminal(color_values, labels, write=write)
 
         # Create the legend image at target height
         if target_height:
@@ -330,89 +471,89 @@ def parse_svg_legend(svg_data, target_height=None, data_type='temperature'):
 
         return img
     except Exception as e:
-        print(f"SVG parse error: {e}")
-        import traceback
+        write(f"SVG parse error: {e}\n")
         traceback.print_exc()
         return None
 
-def download_legend(layer, style="cmap:thermal", tiles_grid=None, target_height=None, data_type='temperature'):
+def download_legend(session, layer, style="cmap:thermal", tiles_grid=None, target_height=None, data_type='temperature',
+                    use_cache=True, write=sys.stdout.write):
     """
     Download the color scale legend from WMTS service as SVG and convert to image
 
     Args:
+        session: Pooled HTTP session shared with the tile downloads
         layer: Layer identifier
         style: Style parameter
         tiles_grid: Not used, kept for compatibility
         target_height: Desired height for the legend
         data_type: Type of data for legend customization
+        use_cache: Reuse a previously downloaded SVG if it is recent enough
+        write: Callable that receives the terminal preview and status lines
 
     Returns:
         PIL Image object or None
     """
-    import urllib.parse
-
-    base_url = "https://wmts.marine.copernicus.eu/teroWmts"
-
-    # Use SVG format (image/svg+xml needs to be URL encoded as image/svg%2Bxml)
-    url = (
-        f"{base_url}?"
-        f"SERVICE=WMTS&"
-        f"REQUEST=GetLegend&"
-        f"LAYER={urllib.parse.quote(layer, safe='')}&"
-        f"STYLE={urllib.parse.quote(style, safe='')}&"
-        f"FORMAT=image/svg%2Bxml"
-    )
+    # Use SVG format; legend parameters are fully percent-encoded, which also
+    # keeps the '+' in image/svg+xml from being read as a space
+    url = build_wmts_url({
+        'SERVICE': 'WMTS',
+        'REQUEST': 'GetLegend',
+        'LAYER': layer,
+        'STYLE': style,
+        'FORMAT': 'image/svg+xml',
+    }, safe='')
+
+    key = hashlib.sha1((layer + style).encode()).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"legend_{key}.svg")
+
+    from_cache = (use_cache
+                  and os.path.exists(cache_path)
+                  and time.time() - os.path.getmtime(cache_path) < LEGEND_CACHE_MAX_AGE)
 
     try:
-        print("Downloading color scale...", end=" ", flush=True)
-        with urllib.request.urlopen(url, timeout=30) as response:
-            svg_data = response.read()
-
-            # Parse SVG manually with target height
-            img = parse_svg_legend(svg_data, target_height=target_height, data_type=data_type)
-            if img:
-                print(f"✓ ({img.width}x{img.height}px)")
-                return img
-            return None
+        if from_cache:
+            with open(cache_path, 'rb') as f:
+                svg_data = f.read()
+        else:
+            response = session.get(url, timeout=30)
+            response.raise_for_status()
+            svg_data = response.content
+
+        # Parse SVG manually with target height
+        img = parse_svg_legend(svg_data, target_height=target_height, data_type=data_type, write=write)
+        if img:
+            # Only cache freshly downloaded legends that parsed successfully
+            if use_cache and not from_cache:
+                write_atomic(cache_path, svg_data)
+            source = "cached" if from_cache else "downloaded"
+            write(f"  Color scale ✓ ({img.width}x{img.height}px, {source})\n")
+            return img
+        return None
     except Exception as e:
-        print(f"✗ {e}")
+        write(f"  Color scale ✗ {e}\n")
         return None
 
-def stitch_tiles(tiles_grid, tile_size=256):
-    """Stitch a grid of tiles into a single image"""
-    rows = len(tiles_grid)
-    cols = len(tiles_grid[0]) if rows > 0 else 0
-    
-    width = cols * tile_size
-    height = rows * tile_size
-    output = Image.new('RGB', (width, height))
-    
-    for row_idx, row in enumerate(tiles_grid):
-        for col_idx, tile in enumerate(row):
-            if tile is not None:
-                x = col_idx * tile_size
-                y = row_idx * tile_size
-                output.paste(tile, (x, y))
-    
-    return output
+def paste_tile(mosaic, tile, row_idx, col_idx, tile_size=TILE_SIZE):
+    """Copy a decoded tile into its slot of a preallocated (H, W, 3) mosaic array"""
+    y = row_idx * tile_size
+    x = col_idx * tile_size
+    # Only convert when needed; RGB tiles (e.g. JPEG) skip the extra image
+    if tile.mode != 'RGB':
+        tile = tile.convert('RGB')
+    mosaic[y:y + tile_size, x:x + tile_size] = np.asarray(tile)
 
 def add_title(image, title, time_str):
     """Add a title banner to the image"""
     # Create new image with space for title
-    title_height = 60
-    new_image = Image.new('RGB', (image.width, image.height + title_height), color='white')
+    new_image = Image.new('RGB', (image.width, image.height + TITLE_HEIGHT), color='white')
     
     # Paste original image below title
-    new_image.paste(image, (0, title_height))
+    new_image.paste(image, (0, TITLE_HEIGHT))
     
     # Draw title
     draw = ImageDraw.Draw(new_image)
-    try:
-        font = ImageFont.truetype("font/PressStart2P.ttf", 24)
-        font_small = ImageFont.truetype("font/PressStart2P.ttf", 14)
-    except:
-        font = ImageFont.load_default()
-        font_small = font
+    font = get_font(24)
+    font_small = get_font(14)
     
     # Draw title text
     draw.text((10, 10), title, fill='black', font=font)
@@ -420,7 +561,8 @@ def add_title(image, title, time_str):
     
     return new_image
 
-def create_map(data_type='temperature', output_file=None, zoom_level=6, days_offset=0, with_legend=True, with_title=True, timestamp_file=None):
+def create_map(data_type='temperature', output_file=None, zoom_level=6, days_offset=0, with_legend=True, with_title=True, timestamp_file=None,
+               use_cache=True, max_workers=8, compress_level=6, fast=False):
     """
     Create a map of New Zealand ocean data
 
@@ -431,6 +573,11 @@ def create_map(data_type='temperature', output_file=None, zoom_level=6, days_off
         days_offset: Days offset (0=today, 1=tomorrow, -1=yesterday)
         with_legend: Include legend in output
         with_title: Include title banner in output
+        timestamp_file: Write the data timestamp to this file if given
+        use_cache: Reuse tiles and legends from the on-disk cache
+        max_workers: Number of concurrent downloads (and pooled connections)
+        compress_level: PNG zlib level, 0-9 (lower is faster, larger files)
+        fast: Request lossy JPEG tiles, which are smaller and quicker to decode
     """
     if data_type not in LAYERS:
         print(f"✗ Unknown data type: {data_type}")
@@ -465,6 +612,9 @@ def create_map(data_type='temperature', output_file=None, zoom_level=6, days_off
             f.write(f"TIME={time_nz.strftime('%H%M')}\n")
             f.write(f"TIMEZONE={time_nz.strftime('%Z')}\n")
 
+    if use_cache:
+        prune_cache()
+
     rows = coverage['row_end'] - coverage['row_start'] + 1
     cols = coverage['col_end'] - coverage['col_start'] + 1
     total_tiles = rows * cols
@@ -477,35 +627,77 @@ def create_map(data_type='temperature', output_file=None, zoom_level=6, days_off
     print(f"  Total tiles: {total_tiles}")
     print()
     
-    # Download tiles
+    # Download tiles in parallel over a pooled session
     print("Downloading tiles:")
-    tiles_grid = []
-    for row in range(coverage['row_start'], coverage['row_end'] + 1):
-        tile_row = []
-        for col in range(coverage['col_start'], coverage['col_end'] + 1):
-            tile = download_tile(
-                layer=config['layer'],
-                tilematrix=zoom_level,
-                tilerow=row,
-                tilecol=col,
-                time_param=time_param,
-                elevation=config['elevation'],
-                style=config['style']
-            )
-            tile_row.append(tile)
-        tiles_grid.append(tile_row)
-    
+    coords = [
+        (row, col)
+        for row in range(coverage['row_start'], coverage['row_end'] + 1)
+        for col in range(coverage['col_start'], coverage['col_end'] + 1)
+    ]
+
+    # Tiles are written straight into one preallocated mosaic as they arrive;
+    # missing tiles stay black
+    mosaic = np.zeros((rows * TILE_SIZE, cols * TILE_SIZE, 3), dtype=np.uint8)
+
+    # Number each finished tile; the lock keeps the count and line order consistent
+    progress_lock = threading.Lock()
+    tiles_done = 0
+
+    def report(message):
+        nonlocal tiles_done
+        with progress_lock:
+            tiles_done += 1
+            write_progress(f"[{tiles_done}/{total_tiles}] {message}")
+
+    def fetch(rc):
+        tile = download_tile(
+            session,
+            layer=config['layer'],
+            tilematrix=zoom_level,
+            tilerow=rc[0],
+            tilecol=rc[1],
+            time_param=time_param,
+            elevation=config['elevation'],
+            style=config['style'],
+            use_cache=use_cache,
+            report=report,
+            tile_format='jpeg' if fast else 'png'
+        )
+        if tile is None:
+            return False
+        # Each worker owns a disjoint slice of the mosaic, so no locking is needed
+        paste_tile(mosaic, tile, rc[0] - coverage['row_start'], rc[1] - coverage['col_start'])
+        return True
+
+    # The output height only depends on the tile grid, so the legend can be
+    # fetched and rendered while the tiles are still downloading
+    map_height = rows * TILE_SIZE + (TITLE_HEIGHT if with_title else 0)
+
+    # One session (and connection pool) serves both the tiles and the legend
+    # Size the pool to the worker count so every worker keeps its own connection
+    with create_session(pool_maxsize=max_workers) as session:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # The legend worker's terminal output is held back and printed with
+            # the rest of the legend steps, so it can't split the tile progress
+            legend_future = None
+            legend_output = []
+            if with_legend:
+                legend_future = executor.submit(
+                    download_legend, session, config['layer'], config['style'],
+                    target_height=map_height, data_type=data_type, use_cache=use_cache,
+                    write=legend_output.append
+                )
+            successful_tiles = sum(executor.map(fetch, coords))
+            legend = legend_future.result() if legend_future else None
+
     # Check success
-    successful_tiles = sum(1 for row in tiles_grid for tile in row if tile is not None)
     if successful_tiles == 0:
         print("\n✗ Failed to download any tiles!")
         return False
-    
+
     print(f"\n✓ Downloaded {successful_tiles}/{total_tiles} tiles")
-    
-    # Stitch tiles
-    print("\nStitching tiles...")
-    final_image = stitch_tiles(tiles_grid)
+
+    final_image = Image.fromarray(mosaic)
 
     # Add title
     if with_title:
@@ -515,8 +707,7 @@ def create_map(data_type='temperature', output_file=None, zoom_level=6, days_off
     # Add legend
     if with_legend:
         print("\nAdding color scale...")
-        legend = download_legend(config['layer'], config['style'], tiles_grid=tiles_grid,
-                                target_height=final_image.height, data_type=data_type)
+        sys.stdout.write(''.join(legend_output))
         if legend:
             # Create new image with legend (legend is already at the correct height)
             padding = 20
@@ -530,10 +721,14 @@ def create_map(data_type='temperature', output_file=None, zoom_level=6, days_off
             print("✓ Color scale embedded")
         else:
             print("⚠ Could not download color scale, continuing without it")
-    
+
     # Save
     print(f"\nSaving to {output_file}...")
-    final_image.save(output_file, optimize=True)
+    if output_file.lower().endswith('.webp'):
+        final_image.save(output_file, format='WEBP', quality=90, method=4)
+    else:
+        # No optimize=True: it retries every filter at level 9 for little gain
+        final_image.save(output_file, compress_level=compress_level)
     
     file_size = os.path.getsize(output_file) / (1024 * 1024)
     
@@ -582,16 +777,27 @@ Color scales are automatically extracted from WMTS and embedded in the output im
     parser.add_argument('-d', '--days', type=int, default=0,
                         help='Days offset: 0=today, 1=tomorrow, -1=yesterday (default: 0)')
     parser.add_argument('-o', '--output',
-                        help='Output filename (auto-generated if not specified)')
+                        help='Output filename, .png or .webp (auto-generated if not specified)')
     parser.add_argument('--no-legend', action='store_true',
                         help='Exclude color scale from output (included by default)')
     parser.add_argument('--no-title', action='store_true',
                         help='Exclude title banner from output (included by default)')
     parser.add_argument('--write-timestamp',
                         help='Write data timestamp to file (format: YYYY-MM-DD HH:MM)')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='Number of concurrent downloads (default: 8)')
+    parser.add_argument('--fast', action='store_true',
+                        help='Download lossy JPEG tiles instead of PNG (smaller, faster, lower quality)')
+    parser.add_argument('--compress-level', type=int, default=6, choices=range(10), metavar='0-9',
+                        help='PNG compression level; lower saves faster but larger (default: 6)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f'Always download tiles and color scale instead of reusing {CACHE_DIR}')
 
     args = parser.parse_args()
 
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
     try:
         success = create_map(
             data_type=args.type,
@@ -600,7 +806,11 @@ Color scales are automatically extracted from WMTS and embedded in the output im
             days_offset=args.days,
             with_legend=not args.no_legend,
             with_title=not args.no_title,
-            timestamp_file=args.write_timestamp
+            timestamp_file=args.write_timestamp,
+            use_cache=not args.no_cache,
+            max_workers=args.workers,
+            compress_level=args.compress_level,
+            fast=args.fast
         )
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
@@ -608,7 +818,6 @@ Color scales are automatically extracted from WMTS and embedded in the output im
         sys.exit(1)
     except Exception as e:
         print(f"\n✗ Error: {e}")
-        import traceback
         traceback.print_exc()
         sys.exit(1)
 